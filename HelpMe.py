@@ -1,10 +1,18 @@
 import os
+import sys
+import atexit
+import signal
 import cv2
 import time
+import queue
+import threading
+import numpy as np
 from datetime import datetime
 from dotenv import load_dotenv
-import geocoder
+from requests import Session
+from requests.adapters import HTTPAdapter
 from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
 from twilio.base.exceptions import TwilioRestException
 
 try:
@@ -12,7 +20,6 @@ try:
     def play_alert_sound():
         winsound.Beep(1000, 300)
 except Exception:
-    import sys
     if sys.platform.startswith("linux") or sys.platform.startswith("darwin"):
         def play_alert_sound():
             print("\a", end="", flush=True)
@@ -20,6 +27,12 @@ except Exception:
         def play_alert_sound():
             pass
 
+try:
+    from turbojpeg import TurboJPEG
+    _jpeg = TurboJPEG()
+except Exception:
+    _jpeg = None
+
 # MediaPipe
 import mediapipe as mp
 mp_hands = mp.solutions.hands
@@ -39,88 +52,122 @@ VIDEO_SOURCE = os.getenv("VIDEO_SOURCE", "0")
 # Control params
 SMS_COOLDOWN = float(os.getenv("SMS_COOLDOWN", "30"))  # seconds
 MAX_HANDS = int(os.getenv("MAX_HANDS", "2"))
+LOCATION_TTL = float(os.getenv("LOCATION_TTL", "300"))  # seconds
+DRAW_LANDMARKS = os.getenv("DRAW_LANDMARKS", "1") == "1"
+# Default to headless on Linux when no display server is available
+_HAS_DISPLAY = (not sys.platform.startswith("linux")
+                or bool(os.getenv("DISPLAY") or os.getenv("WAYLAND_DISPLAY")))
+SHOW_WINDOW = os.getenv("SHOW_WINDOW", "1" if _HAS_DISPLAY else "0") == "1"
+WAIT_KEY_MS = int(os.getenv("WAIT_KEY_MS", "5"))
+FRAME_WIDTH = int(os.getenv("FRAME_WIDTH", "640"))
+FRAME_HEIGHT = int(os.getenv("FRAME_HEIGHT", "480"))
+DETECT_SCALE = float(os.getenv("DETECT_SCALE", "1.0"))  # frame scale fed to MediaPipe
+MOTION_THRESHOLD = int(os.getenv("MOTION_THRESHOLD", "150"))  # changed pixels at 160x120
+HEARTBEAT_FRAMES = int(os.getenv("HEARTBEAT_FRAMES", "15"))  # always detect every N frames (<=0: off)
+USE_OPENCL = os.getenv("USE_OPENCL", "1") == "1" and cv2.ocl.haveOpenCL()
+cv2.ocl.setUseOpenCL(USE_OPENCL)
 
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "screenshots")
 LOG_FILE = os.getenv("LOG_FILE", "alert_log.txt")
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "80"))
+ALERT_DRAIN_TIMEOUT = float(os.getenv("ALERT_DRAIN_TIMEOUT", "30"))  # seconds
 
 if not os.path.exists(OUTPUT_DIR):
     os.makedirs(OUTPUT_DIR)
 
+# Long-lived, line-buffered alert log
+_LOG_FH = open(LOG_FILE, "a", buffering=1)
+_LOG_LOCK = threading.Lock()
+atexit.register(_LOG_FH.close)
+
+# Shared keep-alive session so alerts skip the TCP/TLS handshake
+SESSION = Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=4))
+
 client = None
 if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN:
-    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    http_client = TwilioHttpClient()
+    http_client.session = SESSION
+    client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, http_client=http_client)
 else:
     print("[WARN] Twilio credentials missing — SMS will not be sent.")
 
-# ----------------- Location Fetching -----------------
-def get_location():
-    """Get approximate location via IP, fallback to Hyderabad."""
+def warmup_twilio():
+    """Open the pooled connection to Twilio so the first alert isn't penalized."""
     try:
-        g = geocoder.ip("me")
-        if g.ok:
-            lat, lon = g.latlng
-            city = g.city or "Unknown"
-            print(f"[INFO] Location: {city} ({lat}, {lon})")
-            return lat, lon, city
+        SESSION.head("https://api.twilio.com", timeout=5)
     except Exception as e:
-        print(f"[ERROR] Location fetch failed: {e}")
-    # fallback
-    lat, lon, city = 17.3918, 78.4752, "Hyderabad"
-    print(f"[INFO] Using fallback: {city} ({lat}, {lon})")
-    return lat, lon, city
+        print(f"[WARN] Twilio warmup failed: {e}")
 
-# ----------------- Finger Detection -----------------
-def fingers_up(hand_landmarks):
-    """Return list [Thumb, Index, Middle, Ring, Pinky] -> 1 if up, 0 if folded"""
-    fingers = []
+def now_stamp():
+    """Current local time formatted for filenames and log entries."""
+    return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
 
-    # Thumb (x-axis check)
-    if hand_landmarks.landmark[4].x < hand_landmarks.landmark[3].x:
-        fingers.append(1)
-    else:
-        fingers.append(0)
-
-    # Other fingers (y-axis check)
-    finger_tips = [8, 12, 16, 20]
-    finger_pips = [6, 10, 14, 18]
-
-    for tip, pip in zip(finger_tips, finger_pips):
-        if hand_landmarks.landmark[tip].y < hand_landmarks.landmark[pip].y:
-            fingers.append(1)
-        else:
-            fingers.append(0)
+# ----------------- Location Fetching -----------------
+_loc_cache = {"ts": 0.0, "val": None}
+_loc_lock = threading.Lock()
 
-    return fingers
+def get_location():
+    """Get approximate location via IP (cached), fallback to Hyderabad."""
+    with _loc_lock:
+        if _loc_cache["val"] and time.time() - _loc_cache["ts"] < LOCATION_TTL:
+            return _loc_cache["val"]
+        try:
+            resp = SESSION.get("https://ipinfo.io/json", timeout=2)
+            if resp.ok:
+                data = resp.json()
+                lat, lon = map(float, data["loc"].split(","))
+                city = data.get("city") or "Unknown"
+                print(f"[INFO] Location: {city} ({lat}, {lon})")
+                _loc_cache["ts"], _loc_cache["val"] = time.time(), (lat, lon, city)
+                return lat, lon, city
+        except Exception as e:
+            print(f"[ERROR] Location fetch failed: {e}")
+    # fallback (not cached, so the next alert retries the lookup)
+    lat, lon, city = 17.3918, 78.4752, "Hyderabad"
+    print(f"[INFO] Using fallback: {city} ({lat}, {lon})")
+    return lat, lon, city
 
 # ----------------- Gesture Classification -----------------
-def classify_gesture(fingers):
-    """Classify based on finger states"""
-    thumb, index, middle, ring, pinky = fingers
-
-    if thumb == 1 and index == 1 and middle == 0 and ring == 0 and pinky == 0:
-        return "Kidnap Alert"
-    elif index == 1 and middle == 1 and ring == 1 and thumb == 0 and pinky == 0:
-        return "Medical Emergency"
-    elif thumb == 0 and index == 0 and middle == 0 and ring == 0 and pinky == 0:
-        return "Distress / SOS"
-    elif index == 1 and middle == 1 and ring == 0 and pinky == 0:
-        return "Testing / V-Sign"
-    elif thumb == 1 and pinky == 1 and index == 0 and middle == 0 and ring == 0:
-        return "Call Police"
-    else:
-        return None
+# Landmark indices for the four finger tips and their PIP joints
+TIPS = np.array([8, 12, 16, 20])
+PIPS = np.array([6, 10, 14, 18])
+
+# Fingers are packed as a 5-bit code: Thumb Index Middle Ring Pinky (MSB -> LSB)
+TIP_WEIGHTS = np.array([8, 4, 2, 1], dtype=np.uint8)
+
+GESTURE_LUT = [None] * 32
+GESTURE_LUT[0b11000] = "Kidnap Alert"
+GESTURE_LUT[0b01110] = "Medical Emergency"
+GESTURE_LUT[0b00000] = "Distress / SOS"
+GESTURE_LUT[0b01100] = "Testing / V-Sign"   # thumb is ignored for the V-sign
+GESTURE_LUT[0b11100] = "Testing / V-Sign"
+GESTURE_LUT[0b10001] = "Call Police"
+
+def landmarks_xy(hand_landmarks):
+    """Pull all 21 (x, y) landmark pairs into a (21, 2) array in one pass."""
+    return np.fromiter(
+        (c for p in hand_landmarks.landmark for c in (p.x, p.y)),
+        dtype=np.float32, count=42
+    ).reshape(21, 2)
+
+def classify_hand(hand_landmarks):
+    """Map hand landmarks straight to a gesture name, or None if unrecognised"""
+    lm = landmarks_xy(hand_landmarks)
+
+    # Thumb is up if its tip is left of the IP joint (x-axis check),
+    # other fingers if the tip is above the PIP joint (y-axis check)
+    code = (int(lm[4, 0] < lm[3, 0]) << 4) | int(np.dot(lm[TIPS, 1] < lm[PIPS, 1], TIP_WEIGHTS))
+    return GESTURE_LUT[code]
 
 # ----------------- SMS Sending -----------------
-from twilio.base.exceptions import TwilioRestException
+_BODY_TMPL = "🚨 {g} at {c}. Map: https://maps.google.com/?q={lat},{lon}".format
 
-def send_alert(screenshot_path, gesture_name):
+def send_alert(screenshot_path, gesture_name, timestamp=None):
     """Send alert via SMS, fallback to WhatsApp if SMS blocked (30004)."""
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    timestamp = timestamp or now_stamp()
     lat, lon, city = get_location()
-    location_link = f"https://www.google.com/maps?q={lat},{lon}"
-    body = (
-        f"🚨 {gesture_name} at {city}. Map: https://maps.google.com/?q={lat},{lon}"
-    )
+    body = _BODY_TMPL(g=gesture_name, c=city, lat=lat, lon=lon)
     success = False
     method_used = "SMS"
 
@@ -160,25 +207,219 @@ def send_alert(screenshot_path, gesture_name):
     play_alert_sound()
 
     # Log to file
-    with open(LOG_FILE, "a") as f:
-        f.write(
+    with _LOG_LOCK:
+        _LOG_FH.write(
             f"[{timestamp}] {gesture_name} | {city} | "
             f"{method_used}: {success} | Screenshot: {screenshot_path}\n"
         )
 
+# ----------------- Text Overlays -----------------
+_overlay_cache = {}
+
+def draw_cached_text(frame, text, org, scale, color, thickness):
+    """cv2.putText replacement that rasterizes each distinct label only once."""
+    key = (text, scale, color, thickness)
+    sprite = _overlay_cache.get(key)
+    if sprite is None:
+        (tw, th), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+        pad = thickness
+        img = np.zeros((th + baseline + 2 * pad, tw + 2 * pad, 3), dtype=np.uint8)
+        cv2.putText(img, text, (pad, pad + th), cv2.FONT_HERSHEY_SIMPLEX,
+                    scale, color, thickness)
+        mask = img.any(axis=2, keepdims=True)
+        sprite = _overlay_cache[key] = (img, mask, pad + th, pad)
+    img, mask, dy, dx = sprite
+
+    # Clip the sprite to the frame, then copy only the glyph pixels
+    x0, y0 = org[0] - dx, org[1] - dy
+    fx0, fy0 = max(x0, 0), max(y0, 0)
+    fx1 = min(x0 + img.shape[1], frame.shape[1])
+    fy1 = min(y0 + img.shape[0], frame.shape[0])
+    if fx1 <= fx0 or fy1 <= fy0:
+        return
+    sx, sy = fx0 - x0, fy0 - y0
+    np.copyto(frame[fy0:fy1, fx0:fx1],
+              img[sy:sy + fy1 - fy0, sx:sx + fx1 - fx0],
+              where=mask[sy:sy + fy1 - fy0, sx:sx + fx1 - fx0])
+
+# ----------------- Alert Worker -----------------
+def save_screenshot(path, frame):
+    """Encode frame as JPEG, using libjpeg-turbo when available."""
+    if _jpeg is not None:
+        with open(path, "wb") as f:
+            f.write(_jpeg.encode(frame, quality=JPEG_QUALITY))
+    else:
+        cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY,
+                                  cv2.IMWRITE_JPEG_OPTIMIZE, 0])
+
+def _alert_worker(alert_q):
+    """Save screenshots and send alerts off the capture thread."""
+    while True:
+        item = alert_q.get()
+        if item is None:  # shutdown sentinel, queued after all pending alerts
+            alert_q.task_done()
+            return
+        screenshot_path, frame, gesture_name, timestamp = item
+        try:
+            # Send first so a slow or failing screenshot never delays the SOS
+            try:
+                send_alert(screenshot_path, gesture_name, timestamp)
+            except Exception as e:
+                print(f"[ERROR] Alert sending failed: {e}")
+            try:
+                save_screenshot(screenshot_path, frame)
+            except Exception as e:
+                print(f"[ERROR] Screenshot save failed: {e}")
+        finally:
+            alert_q.task_done()
+
+def start_alert_worker():
+    alert_q = queue.Queue(maxsize=8)
+    worker = threading.Thread(target=_alert_worker, args=(alert_q,), daemon=True)
+    worker.start()
+    return alert_q, worker
+
+def stop_alert_worker(alert_q, worker):
+    """Deliver any queued alerts, then stop the worker (bounded wait)."""
+    try:
+        alert_q.put(None, timeout=ALERT_DRAIN_TIMEOUT)
+    except queue.Full:
+        print("[WARN] Alert queue still full at exit; pending alerts may be lost.")
+        return
+    worker.join(timeout=ALERT_DRAIN_TIMEOUT)
+    if worker.is_alive():
+        print("[WARN] Alert worker did not finish in time; pending alerts may be lost.")
+
+# ----------------- Preprocessing -----------------
+def prepare_rgb(frame, bufs):
+    """Downscale and convert frame to RGB, on the GPU via UMat if OpenCL is available."""
+    # Landmarks are normalized, so detection can run on a smaller copy
+    # The GPU only pays off when there is a resize to offload; a bare channel
+    # swap is cheaper on the CPU than the upload and .get() download
+    if USE_OPENCL and DETECT_SCALE != 1.0:
+        small = cv2.resize(cv2.UMat(frame), (0, 0), fx=DETECT_SCALE, fy=DETECT_SCALE,
+                           interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2RGB).get()
+
+    # CPU path writes into buffers in bufs, reallocated only if the shape changes
+    small = frame
+    if DETECT_SCALE != 1.0:
+        h, w = frame.shape[:2]
+        size = (max(1, round(w * DETECT_SCALE)), max(1, round(h * DETECT_SCALE)))
+        small = bufs.get("small")
+        if small is None or small.shape[1::-1] != size:
+            small = bufs["small"] = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        cv2.resize(frame, size, dst=small, interpolation=cv2.INTER_AREA)
+
+    # MediaPipe needs contiguous input, so convert into a buffer rather than a view
+    rgb = bufs.get("rgb")
+    if rgb is None or rgb.shape != small.shape:
+        rgb = bufs["rgb"] = np.empty_like(small)
+    cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=rgb)
+    return rgb
+
+def motion_level(frame, prev_gray):
+    """Return (changed pixel count vs prev_gray, gray thumbnail of frame)."""
+    gray = cv2.cvtColor(cv2.resize(frame, (160, 120), interpolation=cv2.INTER_AREA),
+                        cv2.COLOR_BGR2GRAY)
+    if prev_gray is None:
+        return None, gray
+    diff = cv2.absdiff(gray, prev_gray)
+    return cv2.countNonZero(cv2.threshold(diff, 20, 255, cv2.THRESH_BINARY)[1]), gray
+
 # ----------------- Video Capture -----------------
 def open_video_source(source):
     if isinstance(source, str) and source.isdigit():
         return cv2.VideoCapture(int(source))
     return cv2.VideoCapture(source)
 
+class FrameReader:
+    """Read frames on a background thread, keeping only the newest one."""
+
+    def __init__(self, cap, stop_event, pool_size=3):
+        self.cap = cap
+        self.stop_event = stop_event
+        self._cond = threading.Condition()
+        # Frames are decoded into a reused pool; the newest slot and the slot
+        # held by the consumer are never overwritten, so a third is required
+        self._pool = [None] * max(pool_size, 3)
+        self._ret, self._latest, self._held = True, -1, -1
+        self._seq = self._last_seq = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while self._running:
+                with self._cond:
+                    i = next(k for k in range(len(self._pool))
+                             if k not in (self._latest, self._held))
+                if not self.cap.grab():
+                    break
+                ret, img = self.cap.retrieve(self._pool[i])
+                if not ret:
+                    break
+                self._pool[i] = img
+                with self._cond:
+                    self._latest = i
+                    self._seq += 1
+                    self._cond.notify()
+        finally:
+            # Always wake the consumer with ret=False, even if grab/retrieve raised
+            with self._cond:
+                self._ret = False
+                self._seq += 1
+                self._cond.notify()
+
+    def read(self):
+        """Block until a newer frame is available; (False, None) once stopped."""
+        with self._cond:
+            while self._seq == self._last_seq:
+                if self.stop_event.is_set() or not self._thread.is_alive():
+                    return False, None
+                self._cond.wait(timeout=0.1)
+            self._last_seq = self._seq
+            if not self._ret:
+                return False, None
+            self._held = self._latest
+            return True, self._pool[self._held]
+
+    def stop(self):
+        self._running = False
+        self._thread.join(timeout=1)
+
 # ----------------- Main Loop -----------------
 def main():
     cap = open_video_source(VIDEO_SOURCE)
     if not cap.isOpened():
         print(f"[ERROR] Could not open source: {VIDEO_SOURCE}")
         return
+    # 640x480 is plenty for hand gestures; ignored by file/stream sources
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
 
+    # First Ctrl-C ends the loop cleanly (the only way out when headless);
+    # a second one raises KeyboardInterrupt, e.g. to abort the alert drain
+    stop_event = threading.Event()
+
+    def _on_sigint(*_):
+        stop_event.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    signal.signal(signal.SIGINT, _on_sigint)
+
+    # Live cameras: drop stale frames so detection always sees a recent one.
+    # Files are read in order on this thread so no frame is skipped.
+    reader = None
+    if VIDEO_SOURCE.isdigit():
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        reader = FrameReader(cap, stop_event)
+
+    alert_q, alert_worker = start_alert_worker()
+    if client:
+        threading.Thread(target=warmup_twilio, daemon=True).start()
+    threading.Thread(target=get_location, daemon=True).start()
     last_sms_time = 0.0
     active_gesture = None
     total_alerts = 0
@@ -189,53 +430,81 @@ def main():
         min_detection_confidence=0.6,
         min_tracking_confidence=0.6
     ) as hands:
-        while cap.isOpened():
-            ret, frame = cap.read()
+        rgb_bufs = {}
+        prev_gray = None
+        hands_seen = False
+        frame_idx = 0
+        while cap.isOpened() and not stop_event.is_set():
+            ret, frame = reader.read() if reader else cap.read()
             if not ret:
                 break
 
             h, w = frame.shape[:2]
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = hands.process(rgb)
+            frame_idx += 1
+
+            # Skip MediaPipe on static, hand-free scenes, with a periodic heartbeat
+            motion, prev_gray = motion_level(frame, prev_gray)
+            if (motion is not None and motion < MOTION_THRESHOLD and not hands_seen
+                    and not active_gesture
+                    and (HEARTBEAT_FRAMES <= 0 or frame_idx % HEARTBEAT_FRAMES)):
+                hand_list = None
+            else:
+                rgb = prepare_rgb(frame, rgb_bufs)
+
+                # Read-only input lets MediaPipe borrow the buffer instead of copying it
+                rgb.flags.writeable = False
+                hand_list = hands.process(rgb).multi_hand_landmarks
+                rgb.flags.writeable = True
+                hands_seen = bool(hand_list)
 
             gesture_detected = None
 
-            if results.multi_hand_landmarks:
-                for hand_landmarks in results.multi_hand_landmarks:
-                    mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+            if hand_list:
+                for hand_landmarks in hand_list:
+                    if DRAW_LANDMARKS:
+                        mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
 
-                    fingers = fingers_up(hand_landmarks)
-                    gesture = classify_gesture(fingers)
+                    gesture = classify_hand(hand_landmarks)
 
                     if gesture:
                         gesture_detected = gesture
-                        cv2.putText(frame, gesture, (10, 40), cv2.FONT_HERSHEY_SIMPLEX,
-                                    1.2, (0, 0, 255), 3)
+                        draw_cached_text(frame, gesture, (10, 40), 1.2, (0, 0, 255), 3)
                         break
 
             now = time.time()
             if gesture_detected and (gesture_detected != active_gesture) and (now - last_sms_time) > SMS_COOLDOWN:
-                active_gesture = gesture_detected
-                last_sms_time = now
-                timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                timestamp = now_stamp()
                 screenshot_path = os.path.join(OUTPUT_DIR, f"screenshot_{timestamp}.jpg")
-                cv2.imwrite(screenshot_path, frame)
-                total_alerts += 1
-                print(f"[ALERT #{total_alerts}] {gesture_detected} detected. Screenshot saved.")
-                send_alert(screenshot_path, gesture_detected)
+                try:
+                    # Copy so the on-screen overlay drawn below isn't captured
+                    alert_q.put_nowait((screenshot_path, frame.copy(), gesture_detected, timestamp))
+                except queue.Full:
+                    print(f"[WARN] Alert queue full; dropping {gesture_detected} alert.")
+                else:
+                    # Only a queued alert counts and starts the cooldown
+                    active_gesture = gesture_detected
+                    last_sms_time = now
+                    total_alerts += 1
+                    print(f"[ALERT #{total_alerts}] {gesture_detected} detected. Alert queued.")
 
             if not gesture_detected:
                 active_gesture = None
 
-            cv2.putText(frame, f"Alerts: {total_alerts}", (10, h - 10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.imshow("Gesture Recognition & Alerts", frame)
+            if SHOW_WINDOW:
+                draw_cached_text(frame, f"Alerts: {total_alerts}", (10, h - 10),
+                                 0.7, (255, 255, 255), 2)
+                cv2.imshow("Gesture Recognition & Alerts", frame)
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+                if cv2.waitKey(WAIT_KEY_MS) & 0xFF == ord('q'):
+                    break
 
+    # Flush queued alerts before releasing the camera and closing the log
+    stop_alert_worker(alert_q, alert_worker)
+    if reader:
+        reader.stop()
     cap.release()
-    cv2.destroyAllWindows()
+    if SHOW_WINDOW:
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     main()